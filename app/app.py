@@ -1,36 +1,61 @@
 """
 app.py: Flask application that provides a /vectorsearch endpoint
-        to perform vector searches on a MongoDB collection.
+        to perform vector searches on a MongoDB collection
+        (one prompt, or many via /vectorsearch/batch), and a /batch
+        endpoint to embed many prompts in one request.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from pymongo.errors import PyMongoError, OperationFailure, NetworkTimeout
-from db import collection, get_embedding, setup_vector_search  # Import necessary utilities
+from db import collection, get_embedding, get_embeddings, to_bson_vectors, setup_vector_search  # Import necessary utilities
 
-app = Flask(__name__)
+# Maximum number of prompts accepted by the batch endpoints
+MAX_BATCH_PROMPTS = 48
+# Number of documents returned per vector search
+SEARCH_LIMIT = 5
 
-@app.route('/vectorsearch', methods=['GET'])
-def vector_search():
-    """
-    Endpoint to perform a vector search on the MongoDB collection.
 
-    This endpoint expects a 'prompt' query parameter and searches the collection
-    using vector embeddings to find similar documents.
+class ORJSONProvider(JSONProvider):
+    """
+    JSON provider that serializes responses with orjson instead of the standard library.
 
-    Returns:
-        JSON response containing the query and the search results.
+    NumPy arrays are serialized natively, and responses are written as bytes
+    without an intermediate str.
     """
-    # Get the "prompt" query parameter
-    prompt = request.args.get('prompt')
 
-    if not prompt:
-        return jsonify({
-            "error": "Missing required query parameter 'prompt'"
-        }), 400
+    option = orjson.OPT_SERIALIZE_NUMPY
 
-    # Generate the embedding for the user's input
-    query_embedding = get_embedding(prompt)
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option), mimetype="application/json")
+
+
+app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
+# Runs the aggregations of a batch search concurrently over the client's connection pool
+search_executor = ThreadPoolExecutor(max_workers=MAX_BATCH_PROMPTS)
+
+
+def _search(query_embedding):
+    """
+    Runs the vector search aggregation for a single query embedding.
+
+    Args:
+        query_embedding (Binary): Query vector as a BSON float32 vector.
+
+    Returns:
+        List[dict]: The most similar documents, with their text and similarity score.
+    """
     # Vector search pipeline
     pipeline = [
         {
@@ -38,8 +63,8 @@ def vector_search():
                 "index": "vector-index",  # Update this to match your vector search index name
                 "queryVector": query_embedding,
                 "path": "embedding",  # The field in the collection where embeddings are stored
-                "exact": True,
-                "limit": 5  # Limit the number of results returned
+                "numCandidates": 100,  # Nearest neighbors considered by the ANN (HNSW) search
+                "limit": SEARCH_LIMIT  # Limit the number of results returned
             }
         },
         {
@@ -57,12 +82,52 @@ def vector_search():
         }
     ]
 
-    # Fetch results using the aggregation pipeline
-    data = []
+    # Fetch all results in a single batch using the aggregation pipeline
+    return list(collection.aggregate(pipeline, batchSize=SEARCH_LIMIT))
+
+
+def _get_prompts():
+    """
+    Reads and validates the list of prompts from a JSON body of the form {"prompts": [...]}.
+
+    Returns:
+        Tuple[List[str], str]: The prompts and None, or None and an error message if the body is invalid.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):  # Missing, invalid, or not a JSON object
+        body = {}
+    prompts = body.get('prompts')
+    if not prompts or not isinstance(prompts, list) or not all(isinstance(p, str) for p in prompts):
+        return None, "Missing required JSON field 'prompts' (a non-empty list of strings)"
+    if len(prompts) > MAX_BATCH_PROMPTS:
+        return None, f"Too many prompts: {len(prompts)} (the batch limit is {MAX_BATCH_PROMPTS})"
+    return prompts, None
+
+
+@app.route('/vectorsearch', methods=['GET'])
+def vector_search():
+    """
+    Endpoint to perform a vector search on the MongoDB collection.
+
+    This endpoint expects a 'prompt' query parameter and searches the collection
+    using vector embeddings to find similar documents.
+
+    Returns:
+        JSON response containing the query and the search results.
+    """
+    # Get the "prompt" query parameter
+    prompt = request.args.get('prompt')
+
+    if not prompt:
+        return jsonify({
+            "error": "Missing required query parameter 'prompt'"
+        }), 400
+
+    # Generate the embedding for the user's input
+    query_embedding = get_embedding(prompt)
+
     try:
-        results = collection.aggregate(pipeline)
-        for doc in results:
-            data.append(doc)
+        data = _search(query_embedding)
     except (PyMongoError, OperationFailure, NetworkTimeout) as e:  # Catch specific MongoDB errors
         return jsonify({"error": f"Database error: {str(e)}"}), 500
     except ValueError as e:  # Catch data-related errors
@@ -74,7 +139,70 @@ def vector_search():
         "results": data
     })
 
+@app.route('/vectorsearch/batch', methods=['POST'])
+def vector_search_batch():
+    """
+    Endpoint to perform vector searches for several prompts in a single round-trip.
+
+    This endpoint expects a JSON body of the form {"prompts": ["...", ...]}.
+    All prompts are embedded with one model call, and their aggregations
+    run concurrently.
+
+    Returns:
+        JSON response containing the search results for each prompt.
+    """
+    prompts, error = _get_prompts()
+
+    if error:
+        return jsonify({
+            "error": error
+        }), 400
+
+    # Generate the embeddings for all prompts at once
+    query_embeddings = to_bson_vectors(get_embeddings(prompts))
+
+    try:
+        all_data = list(search_executor.map(_search, query_embeddings))
+    except (PyMongoError, OperationFailure, NetworkTimeout) as e:  # Catch specific MongoDB errors
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    except ValueError as e:  # Catch data-related errors
+        return jsonify({"error": f"Data error: {str(e)}"}), 400
+
+    return jsonify({
+        "results": [
+            {"query": prompt, "results": data}
+            for prompt, data in zip(prompts, all_data)
+        ]
+    })
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """
+    Endpoint to generate embeddings for several prompts in a single round-trip.
+
+    This endpoint expects a JSON body of the form {"prompts": ["...", ...]}
+    and encodes all prompts with batched model calls.
+
+    Returns:
+        JSON response containing each prompt and its embedding.
+    """
+    prompts, error = _get_prompts()
+
+    if error:
+        return jsonify({
+            "error": error
+        }), 400
+
+    embeddings = get_embeddings(prompts)
+
+    return jsonify({
+        "results": [
+            {"prompt": prompt, "embedding": embedding}
+            for prompt, embedding in zip(prompts, embeddings)
+        ]
+    })
+
 
 if __name__ == '__main__':
     setup_vector_search()
-    app.run(port=8080, debug=True, host='0.0.0.0')
+    app.run(port=8080, host='0.0.0.0')
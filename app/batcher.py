@@ -0,0 +1,81 @@
+"""
+batcher.py: Groups embedding requests from concurrent HTTP handlers into micro-batches,
+            so the model runs one forward pass for many prompts.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class EmbeddingBatcher:
+    """
+    Collects texts submitted by request threads and encodes them together.
+
+    A background worker waits up to `max_wait` seconds after the first text arrives,
+    encodes up to `max_batch` texts with a single call to `encode_fn`, and resolves
+    each caller's future with its own row of the result.
+    """
+
+    def __init__(self, encode_fn, max_batch=32, max_wait=0.005):
+        """
+        Args:
+            encode_fn (Callable[[List[str]], np.ndarray]): Encodes a list of texts in one call.
+            max_batch (int): Maximum number of texts encoded per call.
+            max_wait (float): Time to wait for more texts before encoding, in seconds.
+        """
+        self._encode_fn = encode_fn
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so start the worker lazily in each process
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                worker = threading.Thread(target=self._run, args=(self._queue,), daemon=True)
+                worker.start()
+            return self._queue
+
+    def submit(self, text):
+        """
+        Queues a text for encoding in the next batch.
+
+        Args:
+            text (str): Input text to generate an embedding for.
+
+        Returns:
+            Future: Resolves to the embedding (np.ndarray) of the text.
+        """
+        future = Future()
+        self._ensure_worker().put((text, future))
+        return future
+
+    def _run(self, pending):
+        while True:
+            # Block for the first text, then gather more until the batch is full or time is up
+            batch = [pending.get()]
+            deadline = time.monotonic() + self._max_wait
+            while len(batch) < self._max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                embeddings = self._encode_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
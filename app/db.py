@@ -3,12 +3,26 @@ db.py: Handles MongoDB connection, embedding generation, and setup for vector se
 """
 
 import os
-import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+import ijson
+import numpy as np
+import onnx
+from bson.binary import Binary, BinaryVectorDtype, VECTOR_SUBTYPE
+from onnxruntime import GraphOptimizationLevel, SessionOptions, get_available_providers
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from onnxruntime.transformers.float16 import convert_float_to_float16
+from optimum.onnxruntime import ORTModelForFeatureExtraction
 from pymongo import MongoClient
-from pymongo.operations import SearchIndexModel
-from sentence_transformers import SentenceTransformer
+from pymongo.errors import BulkWriteError
+from pymongo.operations import InsertOne, SearchIndexModel
+from transformers import AutoTokenizer
 from dotenv import load_dotenv
+from huggingface_hub import hf_hub_download
+from batcher import EmbeddingBatcher
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,25 +34,245 @@ if not MONGODB_URI:
 
 
 MODEL="nomic-ai/nomic-embed-text-v1"
-client = MongoClient(MONGODB_URI)
+# Run the model on the GPU when ONNX Runtime was installed with CUDA support (onnxruntime-gpu)
+EXECUTION_PROVIDER = (
+    "CUDAExecutionProvider" if "CUDAExecutionProvider" in get_available_providers()
+    else "CPUExecutionProvider"
+)
+# Precision of the ONNX graph: "fp32", "fp16" (the default on GPU, where tensor cores run it)
+# or "int8" (dynamically quantized weights, for CPUs with VNNI int8 instructions)
+EMBEDDING_PRECISION = os.getenv(
+    "EMBEDDING_PRECISION", "fp16" if EXECUTION_PROVIDER == "CUDAExecutionProvider" else "fp32"
+)
+if EMBEDDING_PRECISION not in ("fp32", "fp16", "int8"):
+    raise ValueError(f"Unsupported EMBEDDING_PRECISION '{EMBEDDING_PRECISION}'")
+# Converted fp16/int8 graphs are cached here, one file per model and precision
+ONNX_CACHE_DIR = os.getenv(
+    "ONNX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "wonders", "onnx")
+)
+
+# Client used by the request handlers (compress the vector payloads on the wire)
+client = MongoClient(MONGODB_URI, maxPoolSize=50, compressors="zstd")
 db = client["ww"]  # Update this with your database name
 collection = db["facts"]  # Update this with your collection name
 
-# Load the embedding model
-model = SentenceTransformer(MODEL, trust_remote_code=True)
+# ONNX Runtime session options (fused kernels, one intra-op thread per core unless overridden)
+session_options = SessionOptions()
+session_options.graph_optimization_level = GraphOptimizationLevel.ORT_ENABLE_ALL
+session_options.intra_op_num_threads = int(os.getenv("ORT_INTRA_OP_THREADS", os.cpu_count()))
+
+
+def _convert_model(model_dir, file_name):
+    """
+    Converts the published ONNX graph to EMBEDDING_PRECISION and saves it in model_dir.
+
+    With "fp16", the graph is converted to half precision; with "int8", the weights
+    of its MatMul layers are quantized to int8 and activations are quantized on the
+    fly. Inputs and outputs stay float32 either way, so callers are unaffected.
+
+    Args:
+        model_dir (str): The directory to save the converted graph and its config in.
+        file_name (str): The file name of the converted graph.
+    """
+    model_path = hf_hub_download(MODEL, "onnx/model.onnx")
+    os.makedirs(model_dir, exist_ok=True)
+    shutil.copy(hf_hub_download(MODEL, "config.json"), os.path.join(model_dir, "config.json"))
+    # Write to a temporary file first, so no other process ever loads a partial graph
+    tmp_path = os.path.join(model_dir, f"{file_name}.{os.getpid()}.tmp")
+    if EMBEDDING_PRECISION == "fp16":
+        onnx.save(convert_float_to_float16(onnx.load(model_path), keep_io_types=True), tmp_path)
+    else:
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, os.path.join(model_dir, file_name))
+
+
+def _load_model():
+    """
+    Loads the ONNX graph published with the embedding model into ONNX Runtime.
+
+    With EMBEDDING_PRECISION set to "fp16" or "int8", the graph is converted once
+    and cached in ONNX_CACHE_DIR; later runs load the cached graph. The ingest step
+    that runs before the server starts its workers does the conversion.
+
+    Returns:
+        ORTModelForFeatureExtraction: The loaded embedding model.
+    """
+    if EMBEDDING_PRECISION == "fp32":
+        return ORTModelForFeatureExtraction.from_pretrained(
+            MODEL,
+            subfolder="onnx",
+            file_name="model.onnx",
+            export=False,
+            trust_remote_code=True,
+            provider=EXECUTION_PROVIDER,
+            session_options=session_options,
+        )
+
+    model_dir = os.path.join(ONNX_CACHE_DIR, MODEL.replace("/", "--"))
+    file_name = f"model_{EMBEDDING_PRECISION}.onnx"
+    if not os.path.exists(os.path.join(model_dir, file_name)):
+        _convert_model(model_dir, file_name)
+    return ORTModelForFeatureExtraction.from_pretrained(
+        model_dir,
+        file_name=file_name,
+        export=False,
+        trust_remote_code=True,
+        provider=EXECUTION_PROVIDER,
+        session_options=session_options,
+    )
+
+
+# Load the embedding model's ONNX graph, executed by ONNX Runtime
+tokenizer = AutoTokenizer.from_pretrained(MODEL)
+model = _load_model()
+
+
+# Batches are padded to a power-of-two sequence length of at least this many tokens
+MIN_SEQUENCE_BUCKET = 32
+
+
+def _tokenize(texts):
+    """
+    Tokenizes a list of texts into padded NumPy model inputs.
+
+    The padded length is rounded up to a power of two, so ONNX Runtime sees a
+    handful of input shapes and can reuse its memory plans across calls.
+
+    Args:
+        texts (List[str]): Input texts to tokenize.
+
+    Returns:
+        BatchEncoding: The model inputs, including the attention mask.
+    """
+    inputs = tokenizer(texts, return_tensors="np", padding=True, truncation=True)
+    length = inputs["input_ids"].shape[1]
+    bucket = min(max(MIN_SEQUENCE_BUCKET, 1 << (length - 1).bit_length()), tokenizer.model_max_length)
+    if bucket > length:
+        for name, values in inputs.items():
+            pad_value = tokenizer.pad_token_id if name == "input_ids" else 0
+            inputs[name] = np.pad(values, ((0, 0), (0, bucket - length)), constant_values=pad_value)
+    return inputs
+
+
+def _embed(inputs):
+    """
+    Runs the ONNX model on tokenized inputs, then mean-pools and L2-normalizes the token embeddings.
+
+    Args:
+        inputs (BatchEncoding): Model inputs returned by _tokenize.
+
+    Returns:
+        np.ndarray: Normalized embeddings with shape (batch size, dimensions).
+    """
+    token_embeddings = model(**inputs).last_hidden_state
+
+    # Mean-pool over the non-padding tokens
+    mask = inputs["attention_mask"][..., np.newaxis].astype(token_embeddings.dtype)
+    summed = (token_embeddings * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    # L2-normalize so that dotProduct matches cosine similarity
+    return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+
+def _encode(texts):
+    """
+    Generates normalized embeddings for a list of texts in a single model call.
+
+    Args:
+        texts (List[str]): Input texts to generate embeddings for.
+
+    Returns:
+        np.ndarray: Normalized embeddings with shape (len(texts), dimensions).
+    """
+    return _embed(_tokenize(texts))
+
+
+# BSON vector header: dtype byte followed by the padding byte (always 0 for float32)
+_FLOAT32_VECTOR_HEADER = BinaryVectorDtype.FLOAT32.value + b"\x00"
+
+
+def to_bson_vectors(embeddings):
+    """
+    Packs embeddings into BSON binary vectors (subtype 9) of little-endian float32 values.
+
+    The whole batch is converted with a single cast, and each vector is built straight from
+    the row's bytes rather than from a list of Python floats.
+
+    Args:
+        embeddings (np.ndarray): Embeddings with shape (count, dimensions).
+
+    Returns:
+        List[Binary]: The embeddings as 4 bytes per dimension, instead of BSON arrays of doubles.
+    """
+    rows = np.ascontiguousarray(embeddings, dtype="<f4")
+    return [Binary(_FLOAT32_VECTOR_HEADER + row.tobytes(), VECTOR_SUBTYPE) for row in rows]
+
+
+def to_bson_vector(embedding):
+    """
+    Packs a single embedding into a BSON binary vector (subtype 9) of float32 values.
 
+    Args:
+        embedding (np.ndarray): A single embedding.
+
+    Returns:
+        Binary: The embedding as 4 bytes per dimension, instead of a BSON array of doubles.
+    """
+    return to_bson_vectors(embedding[np.newaxis])[0]
+
+
+# Concurrent get_embedding calls share one forward pass per micro-batch
+_batcher = EmbeddingBatcher(_encode, max_batch=32, max_wait=0.005)
+
+
+@lru_cache(maxsize=4096)  # The model is fixed per process, so the text alone is the cache key
 def get_embedding(data):
     """
-    Generates vector embeddings for the given data using the SentenceTransformer model.
+    Generates vector embeddings for the given data using the ONNX Runtime model.
+
+    Results are cached in-process, so repeated prompts skip the model entirely.
+    Cache misses are encoded together with other concurrent requests.
 
     Args:
         data (str): Input data to generate embeddings for.
 
     Returns:
-        List[float]: Vector embeddings as a list of floats.
+        Binary: Vector embeddings as a BSON float32 vector.
+    """
+    embedding = _batcher.submit(data).result()
+    return to_bson_vector(embedding)
+
+
+def get_embeddings(texts, batch_size=64):
     """
-    embedding = model.encode(data)
-    return embedding.tolist()
+    Generates vector embeddings for many texts, one model call per batch.
+
+    The next batch is tokenized on a background thread while the model runs the
+    current one; ONNX Runtime releases the GIL, so the two overlap.
+
+    Args:
+        texts (List[str]): Input texts to generate embeddings for.
+        batch_size (int): Number of texts passed to the model per forward pass.
+
+    Returns:
+        np.ndarray: Normalized embeddings with shape (len(texts), dimensions).
+    """
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32)
+
+    embeddings = []
+    # Created per call, since executor threads would not survive a fork of the process
+    with ThreadPoolExecutor(max_workers=1) as tokenizer_pool:
+        next_inputs = tokenizer_pool.submit(_tokenize, batches[0])
+        for next_batch in batches[1:] + [None]:
+            inputs = next_inputs.result()
+            # Keep at most one tokenized batch waiting, to bound memory
+            if next_batch is not None:
+                next_inputs = tokenizer_pool.submit(_tokenize, next_batch)
+            embeddings.append(_embed(inputs))
+    return np.concatenate(embeddings)
 
 
 def _create_vector_search_index():
@@ -66,53 +300,124 @@ def _create_vector_search_index():
     except Exception as e:
         print(f"Error creating search index: {str(e)}")
 
-def _load_sample_data():
+@lru_cache(maxsize=1)
+def _get_ingest_collection():
+    """
+    Returns the collection used to bulk-load the sample data, connecting on first use.
+
+    Its client uses single-node acks and no retryable writes. It is only created by
+    the ingest step, so the server's workers never open these connections.
 
-    # Read data from data.json
+    Returns:
+        Collection: The same collection as `collection`, through the ingest client.
+    """
+    ingest_client = MongoClient(
+        MONGODB_URI,
+        w=1,
+        retryWrites=False,
+        maxPoolSize=16,
+        compressors="zstd",
+        socketTimeoutMS=30000,
+    )
+    return ingest_client["ww"]["facts"]
+
+
+def _insert_documents(documents):
+    """
+    Inserts a batch of documents with a single unordered bulk write.
+
+    Unordered writes keep going past individual failures (e.g. duplicate keys
+    when the sample data was already loaded), so one bad document doesn't
+    drop the rest of the batch.
+
+    Args:
+        documents (List[dict]): Documents to insert.
+
+    Returns:
+        int: Number of documents successfully inserted.
+    """
     try:
-        with open("data.json", encoding="utf-8") as file:
-            data_entries = json.load(file)
+        result = _get_ingest_collection().bulk_write(
+            [InsertOne(document) for document in documents],
+            ordered=False,
+            bypass_document_validation=True,
+        )
+        return result.inserted_count
+    except BulkWriteError as e:
+        print(f"Error inserting documents: {len(e.details['writeErrors'])} failed")
+        return e.details["nInserted"]
     except Exception as e:
-        print(f"Error reading data.json: {str(e)}")
+        print(f"Error inserting documents: {str(e)}")
+        return 0
+
+
+def _read_sample_data(batch_size):
+    """
+    Streams entries from data.json without loading the whole file in memory.
+
+    Args:
+        batch_size (int): Maximum number of entries per yielded batch.
+
+    Yields:
+        List[dict]: The next batch of entries.
+    """
+    with open("data.json", "rb") as file:
+        data_entries = ijson.items(file, "item")
+        while batch := list(islice(data_entries, batch_size)):
+            yield batch
+
+
+def _load_entries(data_entries, model_info):
+    """
+    Generates embeddings for a batch of entries and inserts them as documents.
+
+    Args:
+        data_entries (List[dict]): Entries read from data.json.
+        model_info (dict): Embedding model metadata stored with every document.
+
+    Returns:
+        int: Number of documents successfully inserted.
+    """
+    # Sort by length so each batch pads to a similar sequence length
+    entries = sorted(
+        (entry for entry in data_entries if 'text' in entry),
+        key=lambda entry: len(entry['text'])
+    )
+    if not entries:
         return 0
+    # Keep the fields as parallel columns: ids, texts and one contiguous (count, dimensions) float32 array
+    ids = [entry['_id'] for entry in entries]
+    texts = [entry['text'] for entry in entries]
+    embeddings = get_embeddings(texts, batch_size=64)
+
+    # Prepare the documents; each vector is packed from its row of the embeddings array
+    documents = [
+        {
+            "_id": _id,
+            "text": text,
+            "embedding": vector,
+            "model_info": model_info
+        }
+        for _id, text, vector in zip(ids, texts, to_bson_vectors(embeddings))
+    ]
+    return _insert_documents(documents)
+
 
-    bulk_size = 100
-    buffer = []
+def _load_sample_data():
+
+    bulk_size = 1000
     inserted_doc_count = 0
     model_info = {
         "name": MODEL,
         "created_timestamp": datetime.now().isoformat(),
     }
-    for entry in data_entries:
-        if 'text' in entry:
-            text = entry['text']
-            _id = entry['_id']
-            embedding = get_embedding(text)  # Generate embedding for each text
-
-            # Prepare the document
-            document = {
-                "_id": _id,
-                "text": text,
-                "embedding": embedding,
-                "model_info": model_info
-            }
-            buffer.append(document)
-
-            # If buffer reaches the bulk_size, perform batch insert
-            if len(buffer) == bulk_size:
-                try:
-                    collection.insert_many(buffer)
-                    inserted_doc_count += len(buffer)
-                    buffer.clear()  # Clear buffer after insert
-                except Exception as e:
-                    print(f"Error inserting documents: {str(e)}")
-    # Insert any remaining documents in the buffer
-    if buffer:
-        try:
-            collection.insert_many(buffer)
-            inserted_doc_count += len(buffer)
-        except Exception as e:
-            print(f"Error inserting remaining documents: {str(e)}")
+
+    # Read data from data.json one batch at a time
+    try:
+        for data_entries in _read_sample_data(bulk_size):
+            inserted_doc_count += _load_entries(data_entries, model_info)
+    except (OSError, ijson.JSONError) as e:
+        print(f"Error reading data.json: {str(e)}")
     print(f"Inserted {inserted_doc_count} documents.")
     return inserted_doc_count
 
@@ -135,3 +440,7 @@ def setup_vector_search():
 
     print("Loading sample data...")
     return _load_sample_data()
+
+
+if __name__ == '__main__':
+    setup_vector_search()
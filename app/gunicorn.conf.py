@@ -0,0 +1,44 @@
+"""
+gunicorn.conf.py: Production server settings for the Flask application.
+
+Run with `gunicorn app:app` from this directory.
+"""
+
+import os
+import subprocess
+import sys
+
+# Directory holding the app, db.py and data.json
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+bind = "0.0.0.0:8080"
+
+# Each worker loads its own copy of the model; its threads feed the embedding micro-batcher.
+# The app is not preloaded: ONNX Runtime's thread pools do not survive a fork,
+# so the model must be created inside each worker.
+worker_class = "gthread"
+workers = 4
+threads = 8
+
+
+def on_starting(server):
+    """
+    Loads the sample data once, before any worker starts.
+
+    This runs db.py in a separate process, from the app directory: the master must
+    never import db, or it would build the ONNX Runtime session before forking
+    and every worker would inherit it.
+    """
+    subprocess.run([sys.executable, os.path.join(APP_DIR, "db.py")], cwd=APP_DIR, check=False)
+
+
+def post_fork(server, worker):
+    """
+    Splits the CPU cores between the workers' ONNX Runtime sessions.
+
+    This is set in each worker only, so the startup ingest keeps every core, and
+    only when ORT_INTRA_OP_THREADS was not set by the user.
+    """
+    os.environ.setdefault(
+        "ORT_INTRA_OP_THREADS", str(max(1, (os.cpu_count() or 1) // server.cfg.workers))
+    )
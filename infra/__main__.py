@@ -2,6 +2,7 @@
 
 # Standard library imports
 import json
+from urllib.parse import quote_plus
 
 # Third-party imports
 import pulumi  # Pulumi SDK for infrastructure as code
@@ -10,12 +11,12 @@ import pulumi_mongodbatlas as mongodbatlas  # Pulumi MongoDB Atlas provider
 
 # Local application imports
 from mongodb_collection import MongoDBCollection  # Custom Pulumi resource
-from config import MONGODB_ATLAS_PROJECT_ID, IP_ADDRESS, VECTOR_DATABASE, VECTOR_COLLECTION, VECTOR_USER, VECTOR_PASSWORD
+from config import SETTINGS, get_ip_address
 
 # Create a *free* MongoDB Atlas cluster running on Google Cloud
 vector_cluster = mongodbatlas.AdvancedCluster(
     "vector-cluster",
-    project_id=MONGODB_ATLAS_PROJECT_ID,
+    project_id=SETTINGS.project_id,
     name="vector-cluster",
     cluster_type="REPLICASET",
     replication_specs=[{
@@ -38,14 +39,14 @@ vector_uri = vector_cluster.connection_strings.apply(lambda c: c[0].standard_srv
 # Create a database user for the cluster with specific privileges
 vector_user = mongodbatlas.DatabaseUser(
     "vector-user",
-    project_id=MONGODB_ATLAS_PROJECT_ID,
-    username=VECTOR_USER,
-    password=VECTOR_PASSWORD,
+    project_id=SETTINGS.project_id,
+    username=SETTINGS.user,
+    password=SETTINGS.password,
     auth_database_name="admin",
     roles=[{
             "role_name" : "readWrite",
-            "database_name" : VECTOR_DATABASE,
-            "collection_name" : VECTOR_COLLECTION
+            "database_name" : SETTINGS.db,
+            "collection_name" : SETTINGS.coll
     }],
     scopes=[{
             "name" : vector_cluster.name,
@@ -54,28 +55,27 @@ vector_user = mongodbatlas.DatabaseUser(
     opts=ResourceOptions(depends_on=[vector_cluster])
 )
 
-# Adds the current IP to the access list of the project
+# Adds the current IP to the access list of the project (skipped on CI without an IP address)
+ip_address = get_ip_address()  # May resolve later, once the background IP lookup is done
 my_current_ip = mongodbatlas.ProjectIpAccessList(
     "my-current-ip",
-    project_id=MONGODB_ATLAS_PROJECT_ID,
-    ip_address=IP_ADDRESS,
+    project_id=SETTINGS.project_id,
+    ip_address=ip_address,
     comment = "Enable local cluster access.",
     opts=ResourceOptions(additional_secret_outputs=['ip_address'])
-)
+) if ip_address is not None else None
 
 # Creates a MongoDB collection for the Vector Search Index
-vector_username = vector_user.username.apply(lambda u: u)
-vector_password = vector_user.password.apply(lambda p: p)
 vector_collection = MongoDBCollection(
     "vector-collection",
     props={
-        "user": vector_username,
-        "pwd": vector_password,
+        "user": vector_user.username,
+        "pwd": vector_user.password,
         "uri": vector_uri,
-        "db": VECTOR_DATABASE,
-        "coll": VECTOR_COLLECTION
+        "db": SETTINGS.db,
+        "coll": SETTINGS.coll
     },
-    opts=ResourceOptions(depends_on=[vector_user, my_current_ip])
+    opts=ResourceOptions(depends_on=[d for d in [vector_user, my_current_ip] if d is not None])
     )
 
 # Define the search index fields
@@ -88,23 +88,31 @@ vector_search_index_fields = [
         "quantization": "scalar"    # Quantization type
     }
 ]
+# Serialized once, compactly, for the search index definition
+VECTOR_SEARCH_INDEX_FIELDS_JSON = json.dumps(vector_search_index_fields, separators=(",", ":"))
 
-# Ensure collection is created before proceeding
+# Registered up front; only its create waits for the collection
 vector_search_index = mongodbatlas.SearchIndex(
     "vector-index",
-    project_id=MONGODB_ATLAS_PROJECT_ID,
+    project_id=SETTINGS.project_id,
     name="vector-index",
     cluster_name=vector_cluster.name,
-    database=VECTOR_DATABASE,
-    collection_name=VECTOR_COLLECTION,
+    database=SETTINGS.db,
+    collection_name=SETTINGS.coll,
     type="vectorSearch",
-    fields=json.dumps(vector_search_index_fields),
+    fields=VECTOR_SEARCH_INDEX_FIELDS_JSON,
     wait_for_index_build_completion=True,
     opts=ResourceOptions(depends_on=[vector_collection])
 )
 
 # Export a full MongoDB URI with credentials and database
-full_mongodb_uri = pulumi.Output.all(VECTOR_USER, VECTOR_PASSWORD, vector_uri, VECTOR_DATABASE).apply(
-    lambda args: f"mongodb+srv://{args[0]}:{args[1]}@{args[2].split('://')[1]}/{args[3]}?retryWrites=true&w=majority"
+full_mongodb_uri = pulumi.Output.all(
+    user=SETTINGS.user,
+    pwd=SETTINGS.password,
+    uri=vector_uri,
+    db=SETTINGS.db,
+).apply(
+    # Credentials are inlined into the URI, so they must be percent-encoded here (and only here)
+    lambda a: f"mongodb+srv://{quote_plus(a['user'])}:{quote_plus(a['pwd'])}@{a['uri'].split('://')[1]}/{a['db']}?retryWrites=true&w=majority"
 )
 pulumi.export("MONGODB_URI", pulumi.Output.secret(full_mongodb_uri))
@@ -4,31 +4,42 @@ This module handles the configuration for deploying MongoDB Atlas resources usin
 It checks that the variables are configured correctly. These should be set via the
 "pulumi config set" commands. However, an .env file can also be provided.
 If an IP address is not set, the module dynamically fetches it using
-the "get_public_ip" function.
+the "get_public_ip" function, in a background thread started once the
+Atlas API keys are validated.
 
 Environment Variables:
 - MONGODB_ATLAS_PROJECT_ID: The MongoDB Atlas project ID where resources will be created.
 - MONGODB_ATLAS_PUBLIC_KEY: The public key for MongoDB Atlas API authentication.
 - MONGODB_ATLAS_PRIVATE_KEY: The private key for MongoDB Atlas API authentication.
 - IP_ADDRESS: The public IP address to be used for accessing MongoDB Atlas resources.
+- CI: When set to "1", "true", or "yes", the public IP address is not detected and no
+  IP access list entry is created unless IP_ADDRESS is set.
 - VECTOR_DATABASE: The name of the MongoDB database to store vector data.
 - VECTOR_COLLECTION: The name of the MongoDB collection to store vector data.
 - VECTOR_USER: The username for accessing the MongoDB vector database.
 - VECTOR_PASSWORD: The password for accessing the MongoDB vector database.
 
+Classes:
+- Settings: The resolved deployment settings, built once as SETTINGS.
+
 Functions:
 - get_public_ip: Fetches the public IP address dynamically if not set in the environment variables.
+- get_ip_address: Returns the configured IP address, or an awaitable for the background lookup.
 """
 # Standard library imports
+import asyncio
 import os
 import sys  # Used for process exit handling
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Union
 
 # Third-party imports
-from dotenv import load_dotenv  # Loads environment variables from .env file
-from pulumi import Config
+from pulumi import Config, Output
 
 # Local application imports
 from utils import get_public_ip  # Function to fetch public IP address
+from utils import load_env_once  # Loads environment variables from .env file, once
 
 
 # Create a Config object
@@ -36,16 +47,11 @@ pulumi_config = Config()
 atlas_config = Config("mongodbatlas")
 
 # Load environment variables from .env file
-load_dotenv()
-
-# MongoDB Atlas project where the resources will be created
-MONGODB_ATLAS_PROJECT_ID = pulumi_config.get('mongodbatlas_projectId') or os.getenv("MONGODB_ATLAS_PROJECT_ID")
-if not MONGODB_ATLAS_PROJECT_ID:
-    raise Exception(
-        "❌ Missing MONGODB_ATLAS_PROJECT_ID.\n"
-        "Set it in your environment or Pulumi config.\n"
-    )
+load_env_once()
 
+# On CI runners the runner's own IP is irrelevant: the project's IP access list is
+# expected to be pre-seeded (e.g. with the Pulumi Cloud IP ranges), so it is not detected
+RUNNING_IN_CI = os.getenv("CI", "").strip().lower() in ("1", "true", "yes")
 
 # If your MongoDB Atlas Organization has
 # "Require IP Access List for the Atlas Administration API" enabled,
@@ -79,20 +85,98 @@ if  not (atlas_config.get("publicKey") or os.getenv("MONGODB_ATLAS_PUBLIC_KEY")
     )
     sys.exit(1)
 
-# Retrieve the public IP address or fetch dynamically if not set
-IP_ADDRESS = pulumi_config.get("mongodbatlas_ip_address") or os.getenv("IP_ADDRESS", get_public_ip())
-if not IP_ADDRESS:
-    print(
-        "❌ Missing IP_ADDRESS.\n"
-        "[Preferred] Please set it via\n"
-        "pulumi config set mongodbatlas_ip_address <ipAddress>\n"
-        "[Alternative] Please add an entry in your .env file\n"
-        "or ensure network connectivity to dynamically fetch it."
-    )
-    sys.exit(1)
+# Use the configured IP address if there is one. Otherwise, start fetching the public IP
+# address now; it is passed to Pulumi as an awaitable input, so the round-trip overlaps
+# with the registration of the other resources
+_configured_ip_address = pulumi_config.get("mongodbatlas_ip_address") or os.getenv("IP_ADDRESS")
+_ip_future = (
+    None if _configured_ip_address or RUNNING_IN_CI
+    else ThreadPoolExecutor(max_workers=1).submit(get_public_ip)
+)
+
+
+async def _await_public_ip():
+    """
+    Waits for the background IP lookup without blocking the Pulumi event loop.
+
+    Returns:
+        str: The fetched public IP address.
+
+    Raises:
+        Exception: If the public IP address could not be fetched.
+    """
+    ip_address = await asyncio.wrap_future(_ip_future)
+    if not ip_address:
+        raise Exception(
+            "❌ Missing IP_ADDRESS.\n"
+            "[Preferred] Please set it via\n"
+            "pulumi config set mongodbatlas_ip_address <ipAddress>\n"
+            "[Alternative] Please add an entry in your .env file\n"
+            "or ensure network connectivity to dynamically fetch it."
+        )
+    return ip_address
+
+
+def get_ip_address():
+    """
+    Retrieves the IP address to add to the project's IP access list.
+
+    The configured IP address takes precedence, and no lookup is made at all
+    when it is set. On CI (see RUNNING_IN_CI) no address is
+    detected. Otherwise this returns an awaitable for the background lookup,
+    to be passed to Pulumi as a resource input.
+
+    Returns:
+        Union[str, Awaitable[str]]: The IP address or an awaitable resolving to it,
+        or None on CI when none is configured.
+    """
+    if _configured_ip_address or RUNNING_IN_CI:
+        return _configured_ip_address
+    return _await_public_ip()
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """
+    The deployment settings, resolved once from Pulumi config with environment variable fallbacks.
+
+    The IP address is not part of the settings: it may still be fetched in the
+    background, see `get_ip_address`.
+    """
+
+    project_id: str
+    db: str
+    coll: str
+    user: str
+    password: Union[str, Output[str]]  # A Pulumi secret when set via "pulumi config set --secret"
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """
+        Builds the settings from Pulumi config, falling back to environment variables and defaults.
+
+        Returns:
+            Settings: The resolved settings.
+
+        Raises:
+            Exception: If the MongoDB Atlas project ID is missing.
+        """
+        # MongoDB Atlas project where the resources will be created
+        project_id = pulumi_config.get('mongodbatlas_projectId') or os.getenv("MONGODB_ATLAS_PROJECT_ID")
+        if not project_id:
+            raise Exception(
+                "❌ Missing MONGODB_ATLAS_PROJECT_ID.\n"
+                "Set it in your environment or Pulumi config.\n"
+            )
+
+        # Fetch variables or use default values
+        return cls(
+            project_id=project_id,
+            db=pulumi_config.get("vector_database") or os.getenv("VECTOR_DATABASE", "ww"),
+            coll=pulumi_config.get("vector_collection") or os.getenv("VECTOR_COLLECTION", "facts"),
+            user=pulumi_config.get("vector_user") or os.getenv("VECTOR_USER", "vector-user"),
+            password=pulumi_config.get_secret("vector_password") or os.getenv("VECTOR_PASSWORD", "v3ct0rp4ssw0rd"),  # For demo purposes only
+        )
+
 
-# Fetch variables or use default values
-VECTOR_DATABASE = pulumi_config.get("vector_database") or os.getenv("VECTOR_DATABASE", "ww")
-VECTOR_COLLECTION = pulumi_config.get("vector_collection") or os.getenv("VECTOR_COLLECTION", "facts")
-VECTOR_USER = pulumi_config.get("vector_user") or os.getenv("VECTOR_USER", "vector-user")
-VECTOR_PASSWORD = pulumi_config.get_secret("vector_password") or os.getenv("VECTOR_PASSWORD", "v3ct0rp4ssw0rd")  # For demo purposes only
+SETTINGS = Settings.from_env()
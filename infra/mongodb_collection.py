@@ -18,9 +18,15 @@ import time
 from typing import Optional, Dict
 
 # Third-party imports
-from pulumi.dynamic import Resource, ResourceProvider, CreateResult
+from pulumi.dynamic import Resource, ResourceProvider, CreateResult, DiffResult
 from pulumi import ResourceOptions  # Pulumi core resource import
-from pymongo import MongoClient, errors  # MongoDB connection imports
+from pymongo import errors  # MongoDB connection imports
+
+# Local application imports
+from utils import get_mongo_client  # Shared, pooled MongoDB clients
+
+# Only report PyMongo errors; configured once, at import
+logging.getLogger('pymongo').setLevel(logging.ERROR)
 
 class MongoDBCollectionProvider(ResourceProvider):
     """
@@ -33,62 +39,68 @@ class MongoDBCollectionProvider(ResourceProvider):
     The resource provider supports basic MongoDB collection creation operations.
     """
 
-    def __connect_with_retry(self,
+    def __command_with_retry(self,
                              props: Dict[str, str],
+                             db_name: str,
+                             command: str,
+                             value: str,
                              max_retries=5,
-                             retry_delay=10) -> MongoClient:
+                             retry_delay=10,
+                             max_retry_delay=60) -> Optional[Dict]:
         """
-        Attempts to connect to MongoDB with retry logic for authentication errors.
+        Runs a database command with retry logic for authentication and server selection errors.
 
-        This method retries the connection if an authentication error occurs (e.g.,
-        incorrect credentials). It will attempt a maximum number of retries, with
-        a delay between each attempt.
+        The shared client connects lazily, so the command itself drives the only server
+        selection and authentication; no separate ping round-trip is made first.
+        This method retries the command if an authentication error occurs (e.g.,
+        incorrect credentials), if no server can be selected within the timeout
+        (e.g., the IP access list is not active yet), if the connection drops or
+        times out, or if the cluster's SRV record does not resolve yet. It will attempt a maximum number of retries, with
+        an exponentially growing delay after each failed attempt. A successful
+        first attempt returns without waiting.
 
         Args:
             props (Dict[str, str]): MongoDB connection details
-            max_retries (int): Maximum number of retry attempts for authentication errors.
-            retry_delay (int): Delay between retry attempts, in seconds.
+            db_name (str): The database to run the command against.
+            command (str): The command name (e.g., "create").
+            value (str): The command's value (e.g., the collection name).
+            max_retries (int): Maximum number of attempts for authentication and connection errors.
+            retry_delay (int): Delay after the first failed attempt, in seconds.
+            max_retry_delay (int): Upper bound on the delay between attempts, in seconds.
 
         Returns:
-            MongoClient: A MongoDB client instance.
+            Optional[Dict]: The command response, or None if the retries were exhausted
+            or a connection error occurred.
 
         Raises:
-            Exception: If unable to authenticate after multiple retries,
-            or if another error occurs during connection.
+            errors.OperationFailure: If the command fails for a reason other than authentication.
         """
         attempt = 0
-        ten_seconds = 10000  # Timeout values in milliseconds
+        last_error = None
         while attempt < max_retries:
+            attempt += 1
             try:
-                # Attempt to create a MongoClient instance
-                client = MongoClient(
-                    props.get("uri"),
-                    username=props.get("user"),
-                    password=props.get("pwd"),
-                    authSource="admin",  # Explicitly set authentication database
-                    # authMechanism="SCRAM-SHA-256",
-                    maxPoolSize=10,
-                    minPoolSize=1,
-                    timeoutMS=ten_seconds,
-                    socketTimeoutMS=ten_seconds,
-                    appname="iac-demo",
-                    connect=False,
-                )
-                time.sleep(retry_delay)
-                # Test the connection by issuing a ping command
-                client.admin.command('ping')
-                # print(f"Ping result: {client.admin.command('ping')}")
-                return client
+                # Get the shared MongoClient instance for this cluster and user
+                client = get_mongo_client(props.get("uri"), props.get("user"), props.get("pwd"))
+                return client[db_name].command(command, value)
+            except (errors.ServerSelectionTimeoutError, errors.AutoReconnect, errors.ConfigurationError) as e:
+                # Handle an unreachable cluster (e.g. the IP access list is still being applied,
+                # or the SRV record of a new cluster does not resolve yet) and network errors
+                print(f"MongoDB connection error: {str(e)}")  # Suppress traceback
+                last_error = e
             except errors.OperationFailure as e:
-                # Handle authentication failure
-                if "bad auth" in str(e):
-                    attempt += 1
-                    time.sleep(retry_delay)
-                else:
-                    print(f"MongoDB operation error: {str(e)}")  # Suppress traceback
+                # Handle authentication failure; let the caller handle any other failure
+                if "bad auth" not in str(e):
+                    raise
+                last_error = e
             except Exception as e:
                 print(f"MongoDB connection error: {str(e)}")  # Suppress tracebac
-        print(f"Failed to authenticate after {max_retries} attempts.")
+                last_error = e
+                break
+            # Back off exponentially, capped at a minute, unless this was the last attempt
+            if attempt < max_retries:
+                time.sleep(min(retry_delay * (2 ** (attempt - 1)), max_retry_delay))
+        print(f"Failed to run '{command}' after {attempt} attempt(s): {str(last_error)}")
         return None
         # If authentication fails after max_retries, raise an exception
         # raise Exception(f"Failed to authenticate after {max_retries} attempts.")
@@ -116,13 +128,6 @@ class MongoDBCollectionProvider(ResourceProvider):
             RuntimeError: If authentication fails, or
             if any error occurs during collection creation.
         """
-        # Set up the logger for PyMongo
-        logging.basicConfig(level=logging.ERROR)  # Set default logging level
-        # Obtain the logger used by PyMongo and set the desired level.
-        logger = logging.getLogger('pymongo')
-        logger.setLevel(logging.ERROR)
-
-        client = None
         try:
             # Suppress all standard error output
             # sys.stderr = open(os.devnull, "w")
@@ -134,15 +139,10 @@ class MongoDBCollectionProvider(ResourceProvider):
             if not db_name or not collection_name:
                 raise ValueError("Database name and collection name must be provided.")
 
-            # Establish a connection to MongoDB with retries
-            client = self.__connect_with_retry(props)
-            if not client:
+            # Create the collection using the MongoDB command, connecting with retries
+            if not self.__command_with_retry(props, db_name, "create", collection_name):
                 raise RuntimeError("Failed to create collection")
 
-            # Create the collection using the MongoDB command
-            client[db_name].command("create", collection_name)
-            client.close()
-
             # Return a successful result with the created collection details
             return CreateResult(id_=f"{db_name}.{collection_name}", outs=props)
 
@@ -156,14 +156,30 @@ class MongoDBCollectionProvider(ResourceProvider):
         except errors.PyMongoError:
             # Catch and raise any MongoDB connection errors
             raise RuntimeError(f"MongoDB connection error.")
-        finally:
-            # Ensure that the client is closed if it was successfully created
-            if client is not None:
-                client.close()
+        # The shared client is left open for reuse; it is torn down when the process exits
         # finally:
             # Restore standard error output
             # sys.stderr = sys.__stderr__
 
+    def diff(self, _id: str, _olds: Dict[str, str], _news: Dict[str, str]) -> DiffResult:
+        """
+        Compares the recorded and requested properties of a MongoDB collection.
+
+        The cluster URI and the database and collection names identify the collection,
+        so a change to any of them replaces it. The username and password are only
+        needed to reach the cluster, and changing them never triggers any work.
+
+        Args:
+            _id (str): The resource ID ("<db>.<collection>").
+            _olds (Dict[str, str]): The properties recorded in the Pulumi state.
+            _news (Dict[str, str]): The properties requested by the program.
+
+        Returns:
+            DiffResult: A Pulumi DiffResult listing the properties that require a replacement.
+        """
+        replaces = [key for key in ("uri", "db", "coll") if _olds.get(key) != _news.get(key)]
+        return DiffResult(changes=bool(replaces), replaces=replaces)
+
 class MongoDBCollection(Resource):
     """
     A Pulumi custom resource representing a MongoDB collection.
@@ -3,37 +3,270 @@ helpers.py
 
 This module provides helper functions for interacting with external services and databases.
 
-1. `get_public_ip`: Fetches the public IP address of the machine using the ipify API.
+1. `get_public_ip`: Fetches the public IP address of the machine, from the cloud
+   metadata service when running on AWS or GCP, or else using the ipify API.
+2. `get_mongo_client`: Returns a long-lived, pooled MongoClient shared by every caller
+   connecting to the same cluster with the same credentials.
+3. `load_env_once`: Loads the .env file into the environment, only on the first call.
 
 Dependencies:
-    - requests: Used for making HTTP requests to external APIs.
+    - requests: Used for making HTTP requests to external APIs, through a shared
+      session with connection pooling and retries.
+    - pymongo: Used for connecting to MongoDB.
+    - python-dotenv: Used for loading environment variables from a .env file.
+
+Environment Variables:
+    - IP_CACHE_TTL: Seconds a fetched public IP address is reused from the on-disk cache (default: 3600).
 
 Usage:
     - Use `get_public_ip` to retrieve the machine's public IP address.
+    - Use `get_mongo_client` instead of creating a MongoClient; do not close the returned client.
 """
 
+import ipaddress
+import json
+import os
+import tempfile
+import time
+from functools import cache, lru_cache
+
 import requests
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+IPIFY_URL = "https://api.ipify.org?format=json"
+
+# Cloud metadata endpoints (link-local, so a miss off-cloud fails fast)
+AWS_METADATA_TOKEN_URL = "http://169.254.169.254/latest/api/token"
+AWS_METADATA_IP_URL = "http://169.254.169.254/latest/meta-data/public-ipv4"
+GCP_METADATA_IP_URL = (
+    "http://169.254.169.254/computeMetadata/v1/instance/"
+    "network-interfaces/0/access-configs/0/external-ip"
+)
+METADATA_TIMEOUT = 0.2  # Seconds
+# The metadata services are only reachable directly, never through a configured proxy
+METADATA_PROXIES = {"http": None, "https": None}
+
+# Shared HTTP session: keeps the TLS connection alive between calls and retries transient errors
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=1,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+# On-disk cache of the last fetched public IP address
+IP_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "wonders", "ip.json")
+DEFAULT_IP_CACHE_TTL = 3600  # Seconds
+
+
+def _read_cached_ip():
+    """
+    Reads the public IP address from the on-disk cache.
+
+    Returns:
+        str: The cached IP address, or None if the cache is missing, invalid, or expired.
+    """
+    try:
+        with open(IP_CACHE_PATH, encoding="utf-8") as file:
+            cached = json.load(file)
+        if time.time() < cached["expires_at"]:
+            return cached["ip"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _get_ip_cache_ttl():
+    """
+    Reads the IP cache TTL from the environment, once the .env file has been loaded.
+
+    Returns:
+        int: IP_CACHE_TTL in seconds, or DEFAULT_IP_CACHE_TTL if it is unset or not an integer.
+    """
+    try:
+        return int(os.getenv("IP_CACHE_TTL", DEFAULT_IP_CACHE_TTL))
+    except ValueError:
+        print(f"Invalid IP_CACHE_TTL, using {DEFAULT_IP_CACHE_TTL} seconds")
+        return DEFAULT_IP_CACHE_TTL
+
+
+def _write_cached_ip(ip):
+    """
+    Atomically writes the public IP address to the on-disk cache.
+
+    The value is written to a temporary file that then replaces the cache file,
+    so concurrent runs never read a partially written cache.
+
+    Args:
+        ip (str): The public IP address to cache.
+    """
+    try:
+        cache_dir = os.path.dirname(IP_CACHE_PATH)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump({"ip": ip, "expires_at": time.time() + _get_ip_cache_ttl()}, file)
+        os.replace(tmp_path, IP_CACHE_PATH)
+    except OSError as e:
+        print(f"Error caching public IP: {e}")
+
+
+def _parse_ip(text):
+    """
+    Validates an IP address returned by a metadata service.
+
+    Args:
+        text (str): The response body.
+
+    Returns:
+        str: The IP address, or None if the body is not a valid IP address.
+    """
+    try:
+        return str(ipaddress.ip_address(text.strip()))
+    except ValueError:
+        return None
+
+
+def _get_aws_public_ip():
+    """
+    Retrieves the public IP address from the AWS instance metadata service (IMDSv2).
+
+    Returns:
+        str: The public IP address, or None if the instance has none or the answer is not an IP address.
+    """
+    token = requests.put(
+        AWS_METADATA_TOKEN_URL,
+        headers={"X-aws-ec2-metadata-token-ttl-seconds": "60"},
+        timeout=METADATA_TIMEOUT,
+        proxies=METADATA_PROXIES,
+    )
+    token.raise_for_status()
+    response = requests.get(
+        AWS_METADATA_IP_URL,
+        headers={"X-aws-ec2-metadata-token": token.text},
+        timeout=METADATA_TIMEOUT,
+        proxies=METADATA_PROXIES,
+    )
+    response.raise_for_status()
+    return _parse_ip(response.text)
+
+
+def _get_gcp_public_ip():
+    """
+    Retrieves the public IP address from the GCP metadata server.
+
+    Returns:
+        str: The external IP address of the first network interface, or None if it has none
+        or the answer is not an IP address.
+    """
+    response = requests.get(
+        GCP_METADATA_IP_URL,
+        headers={"Metadata-Flavor": "Google"},
+        timeout=METADATA_TIMEOUT,
+        proxies=METADATA_PROXIES,
+    )
+    response.raise_for_status()
+    return _parse_ip(response.text)
+
+
+def _get_ipify_public_ip():
+    """
+    Retrieves the public IP address using the ipify API.
+
+    Returns:
+        str: The public IP address of the machine.
+    """
+    response = _SESSION.get(IPIFY_URL, timeout=5)
+    response.raise_for_status()  # Raise an exception for HTTP errors
+    data = response.json()
+    return data["ip"]
+
 
 def get_public_ip():
     """
-    Retrieves the public IP address of the machine using the ipify API.
+    Retrieves the public IP address of the machine.
 
-    This function makes a request to the ipify API (https://api.ipify.org) to fetch the public
-    IP address of the machine. If the request is successful, it returns the IP address as a string.
+    A previously fetched address is returned from the on-disk cache while it is
+    fresher than IP_CACHE_TTL seconds. Otherwise, this function first asks the AWS
+    and GCP metadata services, which answer locally when running on those clouds
+    and fail within METADATA_TIMEOUT elsewhere. As a last resort, it makes a request
+    to the ipify API (https://api.ipify.org) to fetch the public IP address of the machine.
+    If a lookup is successful, it caches and returns the IP address as a string.
     In case of an error (such as a timeout or failed request), it logs the error and returns None.
 
     Returns:
         str: The public IP address of the machine, or None if an error occurred.
     """
+    cached_ip = _read_cached_ip()
+    if cached_ip:
+        return cached_ip
+
+    # Try the cloud metadata services; a miss is expected when not running on that cloud
+    for get_metadata_ip in (_get_aws_public_ip, _get_gcp_public_ip):
+        try:
+            ip = get_metadata_ip()
+        except requests.RequestException:
+            continue
+        if ip:
+            _write_cached_ip(ip)
+            return ip
+
     try:
         # Use ipify API to get the public IP address
-        response = requests.get("https://api.ipify.org?format=json", timeout=5)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        data = response.json()
-        return data["ip"]
+        ip = _get_ipify_public_ip()
+        _write_cached_ip(ip)
+        return ip
     except requests.exceptions.Timeout as e:
         print(f"Error timeout fetching public IP: {e}")
         return None
     except requests.RequestException as e:
         print(f"Error retrieving public IP: {e}")
         return None
+
+
+@lru_cache(maxsize=8)
+def get_mongo_client(uri, user, pwd):
+    """
+    Returns a pooled MongoClient for the given cluster and credentials.
+
+    Clients are cached per (uri, user, pwd), so repeated calls reuse the same
+    connection pool instead of paying a new TLS and SCRAM handshake. The clients
+    live until the process exits and must not be closed by callers.
+
+    Args:
+        uri (str): The MongoDB connection string.
+        user (str): The database username.
+        pwd (str): The database password.
+
+    Returns:
+        MongoClient: A MongoDB client instance.
+    """
+    ten_seconds = 10000  # Timeout values in milliseconds
+    return MongoClient(
+        uri,
+        username=user,
+        password=pwd,
+        authSource="admin",  # Explicitly set authentication database
+        maxPoolSize=50,
+        minPoolSize=1,
+        maxIdleTimeMS=300_000,  # Keep idle sockets for 5 minutes
+        serverSelectionTimeoutMS=ten_seconds,
+        timeoutMS=ten_seconds,
+        socketTimeoutMS=ten_seconds,
+        appname="iac-demo",
+        connect=False,  # Defer server selection to the first command
+    )
+
+
+@cache
+def load_env_once():
+    """
+    Loads environment variables from the .env file, only on the first call.
+
+    Later calls return immediately instead of searching for and re-parsing the file.
+    Variables already present in the environment are never overridden.
+    """
+    load_dotenv(override=False)